@@ -3,9 +3,6 @@
 # Distributed under the GNU GPLv3. See LICENSE.txt or
 # https://www.gnu.org/licenses/gpl.txt
 
-import matplotlib as mp
-import matplotlib.pyplot as plt
-
 import numpy as np
 
 from . import tp
@@ -13,6 +10,23 @@ from . import ptm
 
 import functools
 import copy
+from collections import defaultdict
+
+# matplotlib is only imported when something is plotted, see _load_matplotlib
+mp = None
+plt = None
+
+
+def _load_matplotlib():
+    """Import matplotlib (as mp and plt) on first use, so that simulations that
+    never plot do not pay for its startup."""
+    global mp, plt
+    if mp is None:
+        import matplotlib
+        import matplotlib.lines
+        import matplotlib.pyplot
+        mp = matplotlib
+        plt = matplotlib.pyplot
 
 
 class Qubit:
@@ -96,8 +110,16 @@ class VariableDecoherenceQubit(Qubit):
             1 / deph_rate)
 
 
+def _isclose(a, b, rtol=1e-05, atol=1e-08):
+    """Same as np.allclose(a, b) for two scalars, without creating arrays."""
+    return abs(a - b) <= atol + rtol * abs(b)
+
+
 class Gate:
 
+    # set on gates that do not change the state, so that applying them can be skipped
+    _is_identity = False
+
     def __init__(self, time, conditional_bit=None):
         """A Gate acting at time `time`. If conditional_bit is set, only act when that bit is a classical 1. """
         self.is_measurement = False
@@ -134,6 +156,11 @@ class Gate:
     def involves_qubit(self, bit):
         return bit in self.involved_qubits
 
+    def all_involved_qubits(self):
+        """Return the set of names of all qubits for which involves_qubit is true.
+        """
+        return set(self.involved_qubits)
+
     def apply_to(self, sdm):
         if self.conditional_bit is not None:
             sdm.ensure_classical(self.conditional_bit)
@@ -158,6 +185,8 @@ class SinglePTMGate(Gate):
         self.ptm = ptm
 
     def apply_to(self, sdm):
+        if self._is_identity:
+            return
         sdm.apply_ptm(*self.involved_qubits, ptm=self.ptm)
 
 
@@ -188,9 +217,9 @@ class RotateY(SinglePTMGate):
 
         self.angle = angle
         multiple_of_pi = angle / np.pi
-        if np.allclose(multiple_of_pi, 1):
+        if _isclose(multiple_of_pi, 1):
             self.label = r"$R_y(\pi)$"
-        elif not np.allclose(angle, 0) and np.allclose(np.round(1 / multiple_of_pi, 0), 1 / multiple_of_pi):
+        elif not _isclose(angle, 0) and _isclose(round(1 / multiple_of_pi), 1 / multiple_of_pi):
             divisor = 1 / multiple_of_pi
             self.label = r"$R_y(%s\pi/%d)$" % ("" if divisor >
                                                0 else "-", abs(divisor))
@@ -235,9 +264,9 @@ class RotateX(SinglePTMGate):
 
         self.angle = angle
         multiple_of_pi = angle / np.pi
-        if np.allclose(multiple_of_pi, 1):
+        if _isclose(multiple_of_pi, 1):
             self.label = r"$R_x(\pi)$"
-        elif not np.allclose(angle, 0) and np.allclose(np.round(1 / multiple_of_pi, 0), 1 / multiple_of_pi):
+        elif not _isclose(angle, 0) and _isclose(round(1 / multiple_of_pi), 1 / multiple_of_pi):
             divisor = 1 / multiple_of_pi
             self.label = r"$R_x(\pi/%d)$" % divisor
         else:
@@ -257,9 +286,9 @@ class RotateZ(SinglePTMGate):
 
         self.angle = angle
         multiple_of_pi = angle / np.pi
-        if np.allclose(multiple_of_pi, 1):
+        if _isclose(multiple_of_pi, 1):
             self.label = r"$R_z(\pi)$"
-        elif not np.allclose(angle, 0) and np.allclose(np.round(1 / multiple_of_pi, 0), 1 / multiple_of_pi):
+        elif not _isclose(angle, 0) and _isclose(round(1 / multiple_of_pi), 1 / multiple_of_pi):
             divisor = 1 / multiple_of_pi
             self.label = r"$R_z(\pi/%d)$" % divisor
         else:
@@ -319,6 +348,7 @@ class AmpPhDamp(SinglePTMGate, IdlingGate):
         gamma = 1 - np.exp(-duration / t1)
         lamda = 1 - np.exp(-duration / t_phi)
         super().__init__(bit, time, ptm.amp_ph_damping_ptm(gamma, lamda), **kwargs)
+        self._is_identity = gamma < 1e-12 and lamda < 1e-12
         self.label = r"$%g\,\mathrm{ns}$" % self.duration
 
     def plot_gate(self, ax, coords):
@@ -410,6 +440,7 @@ class TwoPTMGate(Gate):
         sdm.apply_two_ptm(*self.involved_qubits, self.two_ptm)
 
     def plot_gate(self, ax, coords):
+        _load_matplotlib()
         bit0 = self.involved_qubits[-2]
         bit1 = self.involved_qubits[-1]
         ax.scatter((self.time), (coords[bit0]), color='r')
@@ -435,6 +466,7 @@ class CPhase(Gate):
         self.method_params = {}
 
     def plot_gate(self, ax, coords):
+        _load_matplotlib()
         bit0 = self.involved_qubits[-2]
         bit1 = self.involved_qubits[-1]
         ax.scatter((self.time, self.time),
@@ -462,6 +494,7 @@ class CNOT(TwoPTMGate):
         super().__init__(bit0, bit1, p, time, **kwargs)
 
     def plot_gate(self, ax, coords):
+        _load_matplotlib()
         bit0 = self.involved_qubits[-2]
         bit1 = self.involved_qubits[-1]
         ax.scatter((self.time,),
@@ -497,6 +530,7 @@ class ISwap(TwoPTMGate):
         super().__init__(bit0, bit1, p, time, **kwargs)
 
     def plot_gate(self, ax, coords):
+        _load_matplotlib()
         bit0 = self.involved_qubits[-2]
         bit1 = self.involved_qubits[-1]
         ax.scatter((self.time, self.time),
@@ -531,6 +565,7 @@ class ISwapRotation(TwoPTMGate):
         super().__init__(bit0, bit1, p, time, **kwargs)
 
     def plot_gate(self, ax, coords):
+        _load_matplotlib()
         bit0 = self.involved_qubits[-2]
         bit1 = self.involved_qubits[-1]
         ax.scatter((self.time, self.time),
@@ -564,6 +599,7 @@ class Swap(TwoPTMGate):
         super().__init__(bit0, bit1, p, time, **kwargs)
 
     def plot_gate(self, ax, coords):
+        _load_matplotlib()
         bit0 = self.involved_qubits[-2]
         bit1 = self.involved_qubits[-1]
         ax.scatter((self.time, self.time),
@@ -610,6 +646,9 @@ class Measurement(Gate):
 
         If sampler is None, a noiseless Monte Carlo sampler is instantiated with seed 42.
 
+        If the sampler has an attribute `wants_probs` set to False, its outcome does not
+        depend on (p0, p1), and they are not computed; it is sent (0.5, 0.5) instead.
+
         After applying the circuit to a density matrix, the declared measurement results
         are stored in self.measurements.
 
@@ -674,7 +713,10 @@ class Measurement(Gate):
 
     def apply_to(self, sdm):
         bit = self.bit
-        p0, p1 = sdm.peak_measurement(bit)
+        if getattr(self.sampler, "wants_probs", True):
+            p0, p1 = sdm.peak_measurement(bit)
+        else:
+            p0 = p1 = 0.5
 
         declare, project, cond_prob = self.sampler.send((p0, p1))
 
@@ -736,6 +778,12 @@ class ConditionalGate(Gate):
         return any(g.involves_qubit(bit)
                    for g in self.zero_gates + self.one_gates)
 
+    def all_involved_qubits(self):
+        qubits = {self.control_bit}
+        for g in self.zero_gates + self.one_gates:
+            qubits |= g.all_involved_qubits()
+        return qubits
+
     def plot_gate(self, ax, coords):
         for g in self.zero_gates:
             g.plot_gate(ax, coords)
@@ -774,6 +822,7 @@ class ClassicalCNOT(Gate):
         self.bit1 = bit1
 
     def plot_gate(self, ax, coords):
+        _load_matplotlib()
         ax.scatter((self.time,),
                    (coords[self.bit0],), color='k')
         ax.scatter((self.time,),
@@ -853,8 +902,6 @@ class Circuit:
 
         self.qubits.append(qubit)
 
-
-
         return self.qubits[-1]
 
     def add_gate(self, gate_type, *args, **kwargs):
@@ -926,6 +973,7 @@ class Circuit:
         """Add waiting gates to all qubits in the circuit.
 
         The waiting gates are determined by calling Qubit.make_idling_gate (AmpPhDamping by default).
+        Waiting gates that would not change the state (such as for very short gaps) are not added.
 
         If only_qubits is an iterable containing qubit names, gates are only added to those qubits.
 
@@ -948,24 +996,26 @@ class Circuit:
         if only_qubits:
             qubits_to_do = [qb for qb in qubits_to_do if qb.name in only_qubits]
 
+        times = np.array([g.time for g in all_gates])
+        in_range = (tmin <= times) & (times <= tmax)
+        gates_on_qubit = self._gates_by_qubit(all_gates)
+
         for b in qubits_to_do:
-            gts = [
-                gate for gate in all_gates if gate.involves_qubit(
-                    str(b)) and tmin <= gate.time <= tmax]
+            gts = [all_gates[i] for i in gates_on_qubit[str(b)] if in_range[i]]
 
             if not gts:
                 gate = b.make_idling_gate(tmin, tmax)
-                if gate is not None:
+                if gate is not None and not gate._is_identity:
                     self.add_gate(gate)
 
             else:
                 if gts[0].time - tmin > 1e-6:
                     gate = b.make_idling_gate(tmin, gts[0].time)
-                    if gate is not None:
+                    if gate is not None and not gate._is_identity:
                         self.add_gate(gate)
                 if tmax - gts[-1].time > 1e-6:
                     gate = b.make_idling_gate(gts[-1].time, tmax)
-                    if gate is not None:
+                    if gate is not None and not gate._is_identity:
                         self.add_gate(gate)
 
                 for g1, g2 in zip(gts[:-1], gts[1:]):
@@ -977,7 +1027,7 @@ class Circuit:
                         pass
                     else:
                         gate = b.make_idling_gate(g1.time, g2.time)
-                        if gate is not None:
+                        if gate is not None and not gate._is_identity:
                             self.add_gate(gate)
 
     def order(self):
@@ -990,28 +1040,131 @@ class Circuit:
 
         See also: Circuit.apply_to
         """
-        all_gates = list(enumerate(sorted(self.gates, key=lambda g: g.time)))
+        all_gates = list(sorted(self.gates, key=lambda g: g.time))
+
+        gates_on_qubit = self._gates_by_qubit(all_gates)
+        measured_qubits = {g.involved_qubits[-1] for g in all_gates if g.is_measurement}
 
         gts_list = []
         targets = []
         for n, b in enumerate(self.qubits):
-            gts = [n for n, gate in all_gates if gate.involves_qubit(str(b))]
-            if any(all_gates[g][1].is_measurement and all_gates[g][
-                   1].involved_qubits[-1] == b.name for g in gts):
+            gts_list.append(gates_on_qubit[str(b)])
+            if b.name in measured_qubits:
                 targets.append(n)
-            gts_list.append(gts)
 
         order = tp.partial_greedy_toposort(gts_list, targets=targets)
 
         for n, i in enumerate(order):
-            all_gates[i][1].annotation = "%d" % n
+            all_gates[i].annotation = "%d" % n
 
         new_order = []
         for i in order:
-            new_order.append(all_gates[i][1])
+            new_order.append(all_gates[i])
 
         self.gates = new_order
 
+    @staticmethod
+    def _gates_by_qubit(gates):
+        """Return a dict mapping each qubit name to the (ascending) list of indices
+        of the gates in `gates` that involve this qubit, built in one pass over the gates.
+        """
+        gates_on_qubit = defaultdict(list)
+        for i, gate in enumerate(gates):
+            for qb in gate.all_involved_qubits():
+                gates_on_qubit[qb].append(i)
+        return gates_on_qubit
+
+    def combine_single_qubit_gates(self):
+        """Merge runs of single qubit PTM gates on the same qubit into a single gate.
+
+        All unconditional SinglePTMGates acting on a qubit between two other gates involving
+        that qubit are multiplied into one Pauli transfer matrix, which is applied by one
+        SinglePTMGate at the position of the last gate of the run. The effect of the circuit
+        is unchanged, but the product is computed once here instead of every time
+        the circuit is applied.
+
+        The gates must already be in the order of application, so call this after Circuit.order().
+        """
+        new_gates = []
+        runs = {}
+
+        for gate in self.gates:
+            if (isinstance(gate, SinglePTMGate) and not gate.is_measurement and
+                    gate.conditional_bit is None):
+                bit = gate.involved_qubits[-1]
+                if bit in runs:
+                    run = new_gates[runs[bit]]
+                    new_gates[runs[bit]] = None
+                    run.append(gate)
+                else:
+                    run = [gate]
+                runs[bit] = len(new_gates)
+                new_gates.append(run)
+            else:
+                for bit in [b for b in runs if gate.involves_qubit(b)]:
+                    del runs[bit]
+                new_gates.append(gate)
+
+        self.gates = []
+        for gate in new_gates:
+            if isinstance(gate, list):
+                if len(gate) == 1:
+                    gate = gate[0]
+                else:
+                    p = gate[0].ptm
+                    for g in gate[1:]:
+                        p = g.ptm.dot(p)
+                    gate = SinglePTMGate(gate[-1].involved_qubits[-1], gate[-1].time, p)
+            if gate is not None:
+                self.gates.append(gate)
+
+    def absorb_single_qubit_gates(self):
+        """Absorb single qubit PTM gates into the two-qubit gate preceding them.
+
+        An unconditional SinglePTMGate on a qubit whose previous gate is an unconditional
+        CPhase or TwoPTMGate is multiplied into the two-qubit Pauli transfer matrix of that gate,
+        which is replaced by a TwoPTMGate. This moves the matrix products to circuit build time:
+        SparseDM already folds pending single qubit PTMs into the next two-qubit PTM when the
+        circuit is applied, so the number of passes over the density matrix does not change.
+
+        The gates must already be in the order of application, so call this after Circuit.order()
+        (and preferably after Circuit.combine_single_qubit_gates()).
+        """
+        new_gates = []
+        last_two_qubit_gate = {}
+
+        for gate in self.gates:
+            if (isinstance(gate, SinglePTMGate) and not gate.is_measurement and
+                    gate.conditional_bit is None):
+                bit = gate.involved_qubits[-1]
+                if bit in last_two_qubit_gate:
+                    idx = last_two_qubit_gate[bit]
+                    two_gate = new_gates[idx]
+                    bit0, bit1 = two_gate.involved_qubits[-2:]
+                    if isinstance(two_gate, TwoPTMGate):
+                        two_ptm = two_gate.two_ptm
+                    else:
+                        two_ptm = ptm.double_kraus_to_ptm(np.diag([1, 1, 1, -1]))
+                    if bit == bit0:
+                        single_ptm = np.kron(np.eye(4), gate.ptm)
+                    else:
+                        single_ptm = np.kron(gate.ptm, np.eye(4))
+                    new_gates[idx] = TwoPTMGate(
+                        bit0, bit1, single_ptm.dot(two_ptm), two_gate.time)
+                    continue
+
+            for bit in [b for b in last_two_qubit_gate if gate.involves_qubit(b)]:
+                del last_two_qubit_gate[bit]
+
+            if (isinstance(gate, (CPhase, TwoPTMGate)) and
+                    gate.conditional_bit is None):
+                for bit in gate.involved_qubits[-2:]:
+                    last_two_qubit_gate[bit] = len(new_gates)
+
+            new_gates.append(gate)
+
+        self.gates = new_gates
+
     def apply_to(self, sdm, apply_all_pending=True):
         """Apply the gates in the Circuit to a sparsedm.SparseDM density matrix.
         The gates are applied in the order given in self.gates, which is the order in which they are
@@ -1045,6 +1198,8 @@ class Circuit:
 
         buffer = (tmax - tmin) * 0.05
 
+        _load_matplotlib()
+
         coords = {str(qb): number for number, qb in enumerate(self.qubits)}
 
         figure = plt.gcf()
@@ -1068,15 +1223,16 @@ class Circuit:
         return figure, ax
 
     def _plot_qubit_lines(self, ax, coords, tmin, tmax):
+        from matplotlib.collections import LineCollection
+
         buffer = (tmax - tmin) * 0.05
         xdata = (tmin - buffer, tmax + buffer)
-        for qubit in coords:
-            ydata = (coords[qubit], coords[qubit])
-            line = mp.lines.Line2D(xdata, ydata, color='k')
-            ax.add_line(line)
+        segments = [[(xdata[0], y), (xdata[1], y)] for y in coords.values()]
+        ax.add_collection(LineCollection(segments, colors='k'))
+        for qubit, y in coords.items():
             ax.text(
                 xdata[0] - 2 * buffer,
-                ydata[0],
+                y,
                 str(qubit),
                 color='k',
                 ha='center',
@@ -1089,8 +1245,29 @@ def selection_sampler(result=0):
 
     See also: Measurement
     """
-    while True:
-        yield result, result, 1
+    return SelectionSampler(result)
+
+
+class SelectionSampler:
+    """The sampler returned by selection_sampler.
+
+    As its outcome does not depend on the probabilities, it sets wants_probs to False,
+    so that Measurement does not need to compute them.
+    """
+
+    wants_probs = False
+
+    def __init__(self, result=0):
+        self.result = result
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.result, self.result, 1
+
+    def send(self, ps):
+        return self.result, self.result, 1
 
 
 def uniform_sampler(seed=42):
@@ -1104,8 +1281,15 @@ def uniform_sampler(seed=42):
     while not primers_nones:
         primers_nones = yield
     p0, p1 = primers_nones
+    # draw random numbers in batches, this gives the same stream as drawing them one by one
+    rs = []
+    i = 0
     while True:
-        r = rng.random_sample()
+        if i == len(rs):
+            rs = rng.random_sample(1024)
+            i = 0
+        r = rs[i]
+        i += 1
         if r < p0 / (p0 + p1):
             p0, p1 = yield 0, 0, 1
         else:
@@ -1122,14 +1306,20 @@ def uniform_noisy_sampler(readout_error, seed=42):
     while not primers_nones:
         primers_nones = yield
     p0, p1 = primers_nones
+    # draw random numbers in batches, one row per measurement
+    rs = []
+    i = 0
     while True:
-        r = rng.random_sample()
-        if r < p0 / (p0 + p1):
+        if i == len(rs):
+            rs = rng.random_sample((1024, 2))
+            i = 0
+        r_proj, r_decl = rs[i]
+        i += 1
+        if r_proj < p0 / (p0 + p1):
             proj = 0
         else:
             proj = 1
-        r = rng.random_sample()
-        if r < readout_error:
+        if r_decl < readout_error:
             decl = 1 - proj
             prob = readout_error
         else:
@@ -16,11 +16,14 @@ from pycuda.compiler import SourceModule, DEFAULT_NVCC_FLAGS
 
 import sys
 import os
+import collections
 
 import warnings
 
 package_path = os.path.dirname(os.path.realpath(__file__))
 
+_nvcc_options = DEFAULT_NVCC_FLAGS + ["--default-stream", "per-thread", "-lineinfo"]
+
 mod = None
 for kernel_file in [
         sys.prefix +
@@ -29,9 +32,8 @@ for kernel_file in [
         "/primitives.cu"]:
     try:
         with open(kernel_file, "r") as kernel_source_file:
-            mod = SourceModule(
-                kernel_source_file.read(), options=DEFAULT_NVCC_FLAGS+[
-                    "--default-stream", "per-thread", "-lineinfo"])
+            _kernel_source = kernel_source_file.read()
+            mod = SourceModule(_kernel_source, options=_nvcc_options)
             break
     except FileNotFoundError:
         pass
@@ -42,45 +44,145 @@ if mod is None:
 pycuda.autoinit.context.set_shared_config(
     drv.shared_config.EIGHT_BYTE_BANK_SIZE)
 
-_two_qubit_ptm = mod.get_function("two_qubit_ptm")
-_two_qubit_ptm.prepare("PPIII")
-# _cphase = mod.get_function("cphase")
-# _cphase.prepare("PIII")
-_get_diag = mod.get_function("get_diag")
-_get_diag.prepare("PPI")
-_bit_to_pauli_basis = mod.get_function("bit_to_pauli_basis")
-_bit_to_pauli_basis.prepare("PII")
-_pauli_reshuffle = mod.get_function("pauli_reshuffle")
-_pauli_reshuffle.prepare("PPII")
-_single_qubit_ptm = mod.get_function("single_qubit_ptm")
-_single_qubit_ptm.prepare("PPII")
-_dm_reduce = mod.get_function("dm_reduce")
-_dm_reduce.prepare("PIPII")
-_trace = mod.get_function("trace")
-_trace.prepare("Pi")
-_swap = mod.get_function("swap")
-_swap.prepare("PIII")
+# the C type of the density matrix entries in the kernels, by numpy dtype
+_real_types = {np.dtype(np.float64): "double", np.dtype(np.float32): "float"}
+
+
+class _Kernels:
+    """The kernels operating on the real density matrix in the pauli basis,
+    compiled for one floating point type.
+    """
+
+    def __init__(self, module):
+        self.two_qubit_ptm = module.get_function("two_qubit_ptm")
+        self.two_qubit_ptm.prepare("PPIII")
+        self.get_diag = module.get_function("get_diag")
+        self.get_diag.prepare("PPI")
+        self.pauli_reshuffle = module.get_function("pauli_reshuffle")
+        self.pauli_reshuffle.prepare("PPII")
+        self.single_qubit_ptm = module.get_function("single_qubit_ptm")
+        self.single_qubit_ptm.prepare("PPII")
+        self.dm_reduce = module.get_function("dm_reduce")
+        self.dm_reduce.prepare("PIPII")
+        self.trace = module.get_function("trace")
+        self.trace.prepare("Pi")
+        self.swap = module.get_function("swap")
+        self.swap.prepare("PIII")
+
+
+_kernels = {np.dtype(np.float64): _Kernels(mod)}
+
+
+def _get_kernels(dtype):
+    """Return the _Kernels for dtype, compiling them on first use."""
+    dtype = np.dtype(dtype)
+    try:
+        return _kernels[dtype]
+    except KeyError:
+        if dtype not in _real_types:
+            raise ValueError("dtype must be float64 or float32, not %s" % dtype)
+        real_mod = SourceModule(
+            _kernel_source,
+            options=_nvcc_options + ["-DREAL=%s" % _real_types[dtype]])
+        _kernels[dtype] = _Kernels(real_mod)
+        return _kernels[dtype]
+
+
+# page-locked host buffers the traces are read back into, one per dtype,
+# shared by all Density instances so that creating or copying one does not page-lock memory
+_trace_host = {}
+
+
+def _get_trace_host(dtype):
+    """Return the page-locked host buffer for reading back traces of type dtype."""
+    try:
+        return _trace_host[dtype]
+    except KeyError:
+        _trace_host[dtype] = drv.pagelocked_empty(2, dtype)
+        return _trace_host[dtype]
+
+
+_bit_to_pauli_basis_tile = mod.get_function("bit_to_pauli_basis_tile")
+_bit_to_pauli_basis_tile.prepare("PIII")
+
+# single_qubit_ptm compiled for a fixed bit, see _get_single_qubit_ptm_fixed_bit
+_single_qubit_ptm_fixed_bit = {}
+_single_qubit_ptm_fixed_bit_max = 5
+
+
+def _get_single_qubit_ptm_fixed_bit(bit, dtype=np.float64):
+    """Return the single qubit ptm kernel specialized for `bit`, compiling it on first use,
+    or None if bit is too high to have a specialized version.
+    """
+    if bit >= _single_qubit_ptm_fixed_bit_max:
+        return None
+    dtype = np.dtype(dtype)
+    try:
+        return _single_qubit_ptm_fixed_bit[dtype, bit]
+    except KeyError:
+        fixed_mod = SourceModule(
+            _kernel_source,
+            options=_nvcc_options + ["-DREAL=%s" % _real_types[dtype],
+                                     "-DSINGLE_QUBIT_PTM_BIT=%d" % bit])
+        kernel = fixed_mod.get_function("single_qubit_ptm_fixed_bit")
+        kernel.prepare("PPI")
+        _single_qubit_ptm_fixed_bit[dtype, bit] = kernel
+        return kernel
+
+
+def _bit_to_pauli_basis_all(complex_dm, no_qubits):
+    """Transform all bits of a complex density matrix (a gpuarray of shape
+    (2**no_qubits, 2**no_qubits)) to or from the pauli basis, in place.
+
+    Equivalent to running bit_to_pauli_basis once for every bit, but handles four
+    bits per pass over the matrix.
+    """
+    block = (16, 16, 1)
+    grid_size = 2**max(no_qubits - 4, 0)
+    grid = (grid_size, grid_size, 1)
+    for first_bit in range(0, no_qubits, 4):
+        # the tile must fit in the matrix, so the last one may start lower;
+        # apply_mask makes sure no bit is transformed twice
+        tile_first_bit = min(first_bit, max(no_qubits - 4, 0))
+        apply_mask = ((1 << min(first_bit + 4, no_qubits)) - 1) & ~((1 << first_bit) - 1)
+        _bit_to_pauli_basis_tile.prepared_call(
+            grid, block, complex_dm.gpudata, tile_first_bit, apply_mask, no_qubits)
 
 
 class Density:
 
-    _ptm_cache = {}
+    # PTMs already uploaded to the GPU, least recently used first
+    _ptm_cache = collections.OrderedDict()
+    _ptm_cache_size = 256
+
+    # apply single qubit PTMs on bits below 5 with a kernel compiled for that bit,
+    # see _get_single_qubit_ptm_fixed_bit. Opt-in: the first gate on every (dtype, bit)
+    # compiles primitives.cu once more, and no speedup over the generic kernel is measured yet.
+    use_fixed_bit_kernels = False
 
-    def __init__(self, no_qubits, data=None):
+    def __init__(self, no_qubits, data=None, dtype=np.float64):
         """create a new density matrix for several qubits.
         no_qubits: number of qubits.
         data: a numpy.ndarray, gpuarray.array, or pycuda.driver.DeviceAllocation.
               must be of size (2**no_qubits, 2**no_qubits); is copied to GPU if not already there.
               Only upper triangle is relevant.
               If data is None, create a new density matrix with all qubits in ground state.
+        dtype: the floating point type used to store the density matrix on the GPU,
+              np.float64 (default) or np.float32. Single precision halves the memory
+              and the memory traffic of the kernels, at the cost of accuracy.
         """
 
+        self.dtype = np.dtype(dtype)
+        self._kernels = _get_kernels(self.dtype)
+        self._itemsize = self.dtype.itemsize
+
         self.allocated_qubits = 0
         self.allocated_diag = -1
 
         self._set_no_qubits(no_qubits)
 
         self.diag_work = None
+        self._trace_host = _get_trace_host(self.dtype)
 
         if no_qubits > 15:
             raise ValueError(
@@ -95,19 +197,17 @@ class Density:
             grid_size = 2**max(no_qubits - 4, 0)
             grid = (grid_size, grid_size, 1)
             block = (block_size, block_size, 1)
-            for i in range(self.no_qubits):
-                _bit_to_pauli_basis.prepared_call(
-                    grid, block, complex_dm.gpudata, 1 << i, self.no_qubits)
+            _bit_to_pauli_basis_all(complex_dm, self.no_qubits)
 
-            self.data = ga.empty(self._size, np.float64)
-            _pauli_reshuffle.prepared_call(
+            self.data = ga.empty(self._size, self.dtype)
+            self._kernels.pauli_reshuffle.prepared_call(
                 grid, block, complex_dm.gpudata, self.data.gpudata, self.no_qubits, 0)
         elif isinstance(data, ga.GPUArray):
             assert data.size == self._size
-            assert data.dtype == np.float64
+            assert data.dtype == self.dtype
             self.data = data
         elif data is None:
-            d = np.zeros(self._size, np.float64)
+            d = np.zeros(self._size, self.dtype)
             d[0] = 1
             self.data = ga.to_gpu(d)
         else:
@@ -121,40 +221,56 @@ class Density:
         self._blocksize = 2**8
         self._gridsize = 2**max(0, 2 * no_qubits - 8)
 
+        # launch configurations only depend on the number of qubits,
+        # so compute them here instead of before every kernel call
+        self._block = (self._blocksize, 1, 1)
+        self._grid = (self._gridsize, 1, 1)
+        self._diag_block = (2**8, 1, 1)
+        self._diag_grid = (2**max(0, no_qubits - 8), 1, 1)
+        self._trace_block = (2**no_qubits, 1, 1)
+        self._trace_grid = (1, 1, 1)
+
     def trace(self):
 
         if self.no_qubits > 10:
             raise NotImplementedError(
                 "Trace not implemented for more than 10 qubits yet")
-        if self.allocated_diag < self.no_qubits:
-            self.diag_work = ga.empty((1 << self.no_qubits), dtype=np.float64)
-            self.allocated_qubits = self.no_qubits
-        block = (2**self.no_qubits, 1, 1)
-        grid = (1, 1, 1)
+        self._ensure_diag_work()
+        block = self._trace_block
+        grid = self._trace_grid
 
-        _get_diag.prepared_call(
+        self._kernels.get_diag.prepared_call(
             grid,
             block,
             self.data.gpudata,
             self.diag_work.gpudata,
-            np.uint32(self.no_qubits))
+            self.no_qubits)
 
-        _trace.prepared_call(grid, block,
-                             self.diag_work.gpudata, -1, shared_size=8 * block[0])
+        self._kernels.trace.prepared_call(grid, block,
+                                          self.diag_work.gpudata, -1,
+                                          shared_size=self._itemsize * block[0])
 
-        tr0 = self.diag_work[0].get()
+        drv.memcpy_dtoh(self._trace_host[:1], self.diag_work.gpudata)
 
-        return tr0
+        return self._trace_host[0]
+
+    def _ensure_diag_work(self):
+        """Make sure the scratch buffer for the diagonal is large enough.
+        It is kept between calls and only reallocated when the density matrix grows beyond it.
+        """
+        if self.allocated_diag < self.no_qubits:
+            self.diag_work = ga.empty((1 << self.no_qubits), dtype=self.dtype)
+            self.allocated_diag = self.no_qubits
 
     def renormalize(self):
         """Renormalize to trace one."""
         tr = self.trace()
-        self.data *= np.float(1 / tr)
+        self.data *= self.dtype.type(1 / tr)
 
     def copy(self):
         "Return a deep copy of this Density."
-        data_cp = self.data.copy()
-        cp = Density(self.no_qubits, data=data_cp)
+        data_cp = self.data[:self._size].copy()
+        cp = Density(self.no_qubits, data=data_cp, dtype=self.dtype)
         return cp
 
     def to_array(self):
@@ -165,30 +281,23 @@ class Density:
         grid_size = 2**max(self.no_qubits - 4, 0)
         grid = (grid_size, grid_size, 1)
         block = (block_size, block_size, 1)
-        _pauli_reshuffle.prepared_call(
+        self._kernels.pauli_reshuffle.prepared_call(
             grid, block, complex_dm.gpudata, self.data.gpudata, self.no_qubits, 1)
-        for i in range(self.no_qubits):
-            _bit_to_pauli_basis.prepared_call(
-                grid, block, complex_dm.gpudata, 1 << i, self.no_qubits)
+        _bit_to_pauli_basis_all(complex_dm, self.no_qubits)
 
         return complex_dm.get()
 
     def get_diag(self):
-        if self.allocated_diag < self.no_qubits:
-            self.diag_work = ga.empty((1 << self.no_qubits), dtype=np.float64)
-            self.allocated_qubits = self.no_qubits
-
-        block = (2**8, 1, 1)
-        grid = (2**max(0, self.no_qubits - 8), 1, 1)
+        self._ensure_diag_work()
 
-        _get_diag.prepared_call(
-            grid,
-            block,
+        self._kernels.get_diag.prepared_call(
+            self._diag_grid,
+            self._diag_block,
             self.data.gpudata,
             self.diag_work.gpudata,
-            np.uint32(self.no_qubits))
+            self.no_qubits)
 
-        return self.diag_work.get()
+        return self.diag_work[:1 << self.no_qubits].get()
 
     def cphase(self, bit0, bit1):
         assert bit0 < self.no_qubits
@@ -196,91 +305,163 @@ class Density:
 
         warnings.warn("cphase function deprecated, use two_ptm instead", DeprecationWarning)
 
-        block = (self._blocksize, 1, 1)
-        grid = (self._gridsize, 1, 1)
+        block = self._block
+        grid = self._grid
 
-        if "cphase" not in self._ptm_cache:
+        ptm_gpu = self._lookup_ptm("cphase")
+        if ptm_gpu is None:
             p = ptm.double_kraus_to_ptm(np.diag([1,1,1,-1])).real
-            self._ptm_cache["cphase"] = ga.to_gpu(p.astype(np.float64))
+            ptm_gpu = self._store_ptm("cphase", p)
 
-        _two_qubit_ptm.prepared_call(grid, block, self.data.gpudata, self._ptm_cache["cphase"].gpudata, bit0, bit1, self.no_qubits, shared_size=8*(257+self._blocksize))
+        self._kernels.two_qubit_ptm.prepared_call(grid, block, self.data.gpudata, ptm_gpu.gpudata, bit0, bit1, self.no_qubits, shared_size=self._itemsize*(257+self._blocksize))
 
         # _cphase.prepared_call(grid, block,
                               # self.data.gpudata,
                               # bit0, bit1,
                               # self.no_qubits)
 
-    def apply_two_ptm(self, bit0, bit1, ptm):
-        assert bit0 < self.no_qubits
-        assert bit1 < self.no_qubits
-
-        key = hash(ptm.tobytes())
+    def _lookup_ptm(self, key):
+        """Return the uploaded PTM cached under key, or None if there is none."""
+        key = (self.dtype, key)
         try:
             ptm_gpu = self._ptm_cache[key]
         except KeyError:
+            return None
+        self._ptm_cache.move_to_end(key)
+        return ptm_gpu
+
+    def _store_ptm(self, key, ptm):
+        """Upload ptm to the GPU, converted to self.dtype, and cache it under key.
+        If the cache is full, the least recently used PTM is evicted. Its device memory
+        is reused for ptm if shape and dtype match, and freed otherwise.
+        """
+        key = (self.dtype, key)
+        ptm = np.ascontiguousarray(ptm, dtype=self.dtype)
+        ptm_gpu = None
+        while len(self._ptm_cache) >= self._ptm_cache_size:
+            _, old_ptm_gpu = self._ptm_cache.popitem(last=False)
+            if (ptm_gpu is None and old_ptm_gpu.shape == ptm.shape and
+                    old_ptm_gpu.dtype == ptm.dtype):
+                ptm_gpu = old_ptm_gpu
+            else:
+                old_ptm_gpu.gpudata.free()
+        if ptm_gpu is None:
+            ptm_gpu = ga.to_gpu(ptm)
+        else:
+            ptm_gpu.set(ptm)
+        self._ptm_cache[key] = ptm_gpu
+        return ptm_gpu
+
+    def apply_two_ptm(self, bit0, bit1, ptm, key=None):
+        """Apply a 16x16 two-qubit Pauli transfer matrix to bit0 and bit1.
+
+        key: a hashable identifying ptm in the cache of uploaded matrices.
+             If None, it is computed by hashing the matrix entries.
+             SparseDM passes no key: it folds the pending single qubit PTMs into ptm,
+             so the matrix it applies is only known by its entries.
+        """
+        assert bit0 < self.no_qubits
+        assert bit1 < self.no_qubits
+
+        if key is None:
+            key = hash(ptm.tobytes())
+        ptm_gpu = self._lookup_ptm(key)
+        if ptm_gpu is None:
             assert ptm.shape == (16, 16)
             assert ptm.dtype == np.float64
-            self._ptm_cache[key] = ga.to_gpu(ptm)
-            ptm_gpu = self._ptm_cache[key]
+            ptm_gpu = self._store_ptm(key, ptm)
+
+        block = self._block
+        grid = self._grid
 
-        block = (self._blocksize, 1, 1)
-        grid = (self._gridsize, 1, 1)
+        self._kernels.two_qubit_ptm.prepared_call(grid, block,
+                                                  self.data.gpudata, ptm_gpu.gpudata, bit0, bit1, self.no_qubits,
+                                                  shared_size=self._itemsize * (256 + self._blocksize))
 
-        _two_qubit_ptm.prepared_call(grid, block,
-                                        self.data.gpudata, ptm_gpu.gpudata, bit0, bit1, self.no_qubits,
-                                        shared_size=8 * (256 + self._blocksize))
+    def apply_ptm(self, bit, ptm, key=None):
+        """Apply a 4x4 Pauli transfer matrix (in 0xy1 basis) to bit.
 
-    def apply_ptm(self, bit, ptm):
+        key: a hashable identifying ptm in the cache of uploaded matrices,
+             such as ("rotate_y", angle). If None, it is computed by hashing the
+             matrix entries, which is slower.
+             SparseDM passes no key: it applies products of the PTMs pending on a bit,
+             which are only known by their entries.
+        """
         assert bit < self.no_qubits
 
-        key = hash(ptm.tobytes())
-        try:
-            ptm_gpu = self._ptm_cache[key]
-        except KeyError:
+        if key is None:
+            key = hash(ptm.tobytes())
+        ptm_gpu = self._lookup_ptm(key)
+        if ptm_gpu is None:
             assert ptm.shape == (4, 4)
             assert ptm.dtype == np.float64
-            self._ptm_cache[key] = ga.to_gpu(ptm)
-            ptm_gpu = self._ptm_cache[key]
+            ptm_gpu = self._store_ptm(key, ptm)
+
+        self.apply_prepared_ptm(bit, ptm_gpu)
+
+    def apply_prepared_ptm(self, bit, ptm_gpu):
+        """Apply a 4x4 Pauli transfer matrix (in 0xy1 basis) that has already been
+        uploaded to the GPU as a gpuarray of type self.dtype. No hashing or host-side work is done,
+        so this is the cheapest way to apply a fixed gate many times.
+        """
+        assert bit < self.no_qubits
+        assert ptm_gpu.dtype == self.dtype and ptm_gpu.size == 16
 
-        block = (self._blocksize, 1, 1)
-        grid = (self._gridsize, 1, 1)
+        block = self._block
+        grid = self._grid
 
-        _single_qubit_ptm.prepared_call(grid, block,
-                                        self.data.gpudata, ptm_gpu.gpudata, bit, self.no_qubits,
-                                        shared_size=8 * (17 + self._blocksize))
+        if self.use_fixed_bit_kernels and bit < _single_qubit_ptm_fixed_bit_max:
+            kernel = _get_single_qubit_ptm_fixed_bit(bit, self.dtype)
+            kernel.prepared_call(grid, block,
+                                 self.data.gpudata, ptm_gpu.gpudata, self.no_qubits,
+                                 shared_size=self._itemsize * (17 + self._blocksize))
+        else:
+            self._kernels.single_qubit_ptm.prepared_call(grid, block,
+                                                         self.data.gpudata, ptm_gpu.gpudata, bit, self.no_qubits,
+                                                         shared_size=self._itemsize * (17 + self._blocksize))
 
     def hadamard(self, bit):
         warnings.warn("hadamard deprecated, use apply_ptm", DeprecationWarning)
-        self.apply_ptm(bit, ptm.hadamard_ptm())
+        ptm_gpu = self._lookup_ptm("hadamard")
+        if ptm_gpu is None:
+            ptm_gpu = self._store_ptm("hadamard", ptm.hadamard_ptm())
+        self.apply_prepared_ptm(bit, ptm_gpu)
 
     def amp_ph_damping(self, bit, gamma, lamda):
         warnings.warn("amp_ph_damping deprecated, use apply_ptm", DeprecationWarning)
-        self.apply_ptm(bit, ptm.amp_ph_damping_ptm(gamma, lamda))
+        self.apply_ptm(bit, ptm.amp_ph_damping_ptm(gamma, lamda),
+                       key=("amp_ph_damping", gamma, lamda))
 
     def rotate_y(self, bit, angle):
         warnings.warn("rotate_y deprecated, use apply_ptm", DeprecationWarning)
-        self.apply_ptm(bit, ptm.rotate_y_ptm(angle))
+        self.apply_ptm(bit, ptm.rotate_y_ptm(angle), key=("rotate_y", angle))
 
     def rotate_x(self, bit, angle):
         warnings.warn("rotate_x deprecated, use apply_ptm", DeprecationWarning)
-        self.apply_ptm(bit, ptm.rotate_x_ptm(angle))
+        self.apply_ptm(bit, ptm.rotate_x_ptm(angle), key=("rotate_x", angle))
 
     def rotate_z(self, bit, angle):
         warnings.warn("rotate_z deprecated, use apply_ptm", DeprecationWarning)
-        self.apply_ptm(bit, ptm.rotate_z_ptm(angle))
+        self.apply_ptm(bit, ptm.rotate_z_ptm(angle), key=("rotate_z", angle))
 
     def add_ancilla(self, anc_st):
         """Add an ancilla in the ground or excited state as the highest new bit.
         """
 
-        byte_size_of_smaller_dm = 2**(2 * self.no_qubits) * 8
+        byte_size_of_smaller_dm = 2**(2 * self.no_qubits) * self._itemsize
 
         if self.allocated_qubits == self.no_qubits:
-            # allocate larger memory
-            new_dm = ga.zeros(self._size * 4, np.float64)
+            # allocate larger memory, and only clear the parts
+            # that are not overwritten by the old density matrix
+            new_dm = ga.empty(self._size * 4, self.dtype)
             offset = anc_st * 3 * byte_size_of_smaller_dm
             drv.memcpy_dtod(int(new_dm.gpudata) + offset,
                                   self.data.gpudata, byte_size_of_smaller_dm)
+            if anc_st == 0:
+                drv.memset_d8(int(new_dm.gpudata) + byte_size_of_smaller_dm,
+                              0, 3 * byte_size_of_smaller_dm)
+            if anc_st == 1:
+                drv.memset_d8(new_dm.gpudata, 0, 3 * byte_size_of_smaller_dm)
 
             self.data = new_dm
         else:
@@ -301,40 +482,40 @@ class Density:
         if self.no_qubits > 10:
             raise NotImplementedError(
                 "Trace not implemented for more than 10 qubits yet")
-        if self.allocated_diag < self.no_qubits:
-            self.diag_work = ga.empty((1 << self.no_qubits), dtype=np.float64)
-            self.allocated_qubits = self.no_qubits
-        block = (2**self.no_qubits, 1, 1)
-        grid = (1, 1, 1)
+        self._ensure_diag_work()
+        block = self._trace_block
+        grid = self._trace_grid
 
-        _get_diag.prepared_call(
+        self._kernels.get_diag.prepared_call(
             grid,
             block,
             self.data.gpudata,
             self.diag_work.gpudata,
-            np.uint32(self.no_qubits))
+            self.no_qubits)
 
-        _trace.prepared_call(grid, block,
-                             self.diag_work.gpudata, bit, shared_size=8 * block[0])
+        self._kernels.trace.prepared_call(grid, block,
+                                          self.diag_work.gpudata, bit,
+                                          shared_size=self._itemsize * block[0])
 
-        tr1, tr0 = self.diag_work[:2].get()
+        drv.memcpy_dtoh(self._trace_host, self.diag_work.gpudata)
+        tr1, tr0 = self._trace_host
         return tr0, tr1
 
     def project_measurement(self, bit, state):
         assert bit < self.no_qubits
 
-        block = (self._blocksize, 1, 1)
-        grid = (self._gridsize, 1, 1)
+        block = self._block
+        grid = self._grid
 
         if bit != self.no_qubits - 1:
-            _swap.prepared_call(grid, block,
-                                self.data.gpudata,
-                                bit,
-                                self.no_qubits - 1,
-                                self.no_qubits)
+            self._kernels.swap.prepared_call(grid, block,
+                                             self.data.gpudata,
+                                             bit,
+                                             self.no_qubits - 1,
+                                             self.no_qubits)
 
         if state == 1:
-            byte_size_of_smaller_dm = 2**(2 * self.no_qubits - 2) * 8
+            byte_size_of_smaller_dm = 2**(2 * self.no_qubits - 2) * self._itemsize
             drv.memcpy_dtod(self.data.gpudata,
                                   int(self.data.gpudata) + 3 *
                                   byte_size_of_smaller_dm,
@@ -4,6 +4,12 @@
 
 #include <cuda.h> 
 
+//REAL is the floating point type of the density matrix in the pauli basis
+//(the complex density matrix is always double), compile with -DREAL=float for single precision
+#ifndef REAL
+#define REAL double
+#endif
+
 //kernel to transform to pauli basis (up, x, y, down)
 //to be run on a complete complex density matrix, once for each bit
 //this operation is its own inverse (can also be used in opposite direction)
@@ -37,13 +43,70 @@ __global__ void bit_to_pauli_basis(double *complex_dm, unsigned int mask, unsign
 }
 
 
+//same transformation as bit_to_pauli_basis, but for up to four bits in one pass.
+//each block loads a 16x16 tile whose row and column addresses only differ in bits
+//first_bit..first_bit+3 to shared memory, transforms all bits in apply_mask
+//that fall into this range, and writes the tile back.
+//run with blocks of 16x16 and a 2d grid of size (2**max(no_qubits-4, 0))^2,
+//first_bit must be <= max(no_qubits-4, 0).
+__global__ void bit_to_pauli_basis_tile(double *complex_dm, unsigned int first_bit, unsigned int apply_mask, unsigned int no_qubits) {
+    const unsigned int tx = threadIdx.x;
+    const unsigned int ty = threadIdx.y;
+
+    const double sqrt2 =  0.70710678118654752440;
+
+    //block index bits below first_bit stay in place, the others are moved above the tile
+    const unsigned int low_mask = (1 << first_bit) - 1;
+    const unsigned int x = (blockIdx.x & low_mask) | (tx << first_bit) | ((blockIdx.x & ~low_mask) << 4);
+    const unsigned int y = (blockIdx.y & low_mask) | (ty << first_bit) | ((blockIdx.y & ~low_mask) << 4);
+
+    __shared__ double tile_re[16][16];
+    __shared__ double tile_im[16][16];
+
+    //no early return, all threads must reach __syncthreads
+    const bool active = (x < (1 << no_qubits)) && (y < (1 << no_qubits));
+    const unsigned int addr = ((x << no_qubits) | y) << 1;
+
+    if (active) {
+        tile_re[tx][ty] = complex_dm[addr];
+        tile_im[tx][ty] = complex_dm[addr + 1];
+    }
+    __syncthreads();
+
+    for (unsigned int i = 0; i < 4; i++) {
+        const unsigned int m = 1 << i;
+        if (!(apply_mask & (m << first_bit))) continue;
+
+        //the partners of an active entry only differ in bits < no_qubits, so they are active too
+        if (active && (tx & m) && (~ty & m)) {
+            double b = tile_re[tx][ty];
+            double c = tile_re[tx & ~m][ty | m];
+            tile_re[tx][ty] = (b+c)*sqrt2;
+            tile_re[tx & ~m][ty | m] = (b-c)*sqrt2;
+        }
+        if (active && (~tx & m) && (ty & m)) {
+            double b = tile_im[tx | m][ty & ~m];
+            double c = tile_im[tx][ty];
+            tile_im[tx | m][ty & ~m] = (b+c)*sqrt2;
+            tile_im[tx][ty] = (b-c)*sqrt2;
+        }
+        __syncthreads();
+    }
+
+    if (active) {
+        complex_dm[addr] = tile_re[tx][ty];
+        complex_dm[addr + 1] = tile_im[tx][ty];
+    }
+}
+
+
 //pauli_reshuffle
 //this function collects the values from a complex density matrix in (0, x, iy, 1) basis
 //and collects the real or values only; furthermore it rearranges the address bit order 
 //from (d_state_bits, d_state_bits) to 
 // (alpha_d, alpha_d-1, ..., alpha_0) where alpha = (00, 01, 10, 11) for 0, x, y, 1
 //if direction = 0, the copy is performed from complex to real, otherwise from real to complex
-__global__ void pauli_reshuffle(double *complex_dm, double *real_dm, unsigned int no_qubits, unsigned int direction) {
+__global__ void pauli_reshuffle(double *complex_dm, REAL *real_dm, unsigned int no_qubits, unsigned int direction) {
 
     const int x = (blockIdx.x *blockDim.x) + threadIdx.x;
     const int y = (blockIdx.y *blockDim.y) + threadIdx.y;
@@ -90,7 +153,7 @@ __global__ void pauli_reshuffle(double *complex_dm, double *real_dm, unsigned in
 
 
 
-__global__ void two_qubit_general_ptm(double *dm, double *ptm_g, 
+__global__ void two_qubit_general_ptm(REAL *dm, REAL *ptm_g, 
         unsigned int dim_a, unsigned int stride_a,
         unsigned int dim_b, unsigned int stride_b,
         unsigned int dim_rho) {
@@ -98,9 +161,9 @@ __global__ void two_qubit_general_ptm(double *dm, double *ptm_g,
     const unsigned int idx = threadIdx.x + blockIdx.x*blockDim.x;
 
 
-    // external memory required: (blockDim.x + dim_a*dim_b) double floats
-    extern __shared__ double ptm[];
-    double *data = &ptm[dim_a*dim_b]; 
+    // external memory required: (blockDim.x + dim_a*dim_b) floats
+    extern __shared__ REAL ptm[];
+    REAL *data = &ptm[dim_a*dim_b]; 
 
     // load ptm to shared memory (ptm should be smaller than block, but in case it is not, loop here)
     for(int i=0; i < dim_a*dim_b; i+=blockDim.x) {
@@ -137,7 +200,7 @@ __global__ void two_qubit_general_ptm(double *dm, double *ptm_g,
     /*int row = idx_b*dim_b + idx_a;//000 ib ia;*/
     /*int offset = idx - row;          //x y z00;*/
 
-    double acc=1;
+    REAL acc=1;
     /*for(int i=0; i<dim_a*dim_b; i++) {*/
         /*acc += ptm[dim_a*dim_b*row + i]*data[offset+i];*/
     /*}*/
@@ -150,7 +213,8 @@ __global__ void two_qubit_general_ptm(double *dm, double *ptm_g,
 
 // apply a 4x4 pauli transfer matrix (in 0, x, y, 1 basis)
 // to the specified qubit
-__global__ void single_qubit_ptm(double *dm, double *ptm_g,  unsigned int bit, unsigned int no_qubits) {
+// (body shared by the generic kernel and the fixed bit kernel below)
+__device__ __forceinline__ void single_qubit_ptm_body(REAL *dm, REAL *ptm_g, const unsigned int bit, unsigned int no_qubits) {
     const unsigned int x = threadIdx.x;
     const unsigned int high_x = blockIdx.x * blockDim.x;
 
@@ -164,8 +228,8 @@ __global__ void single_qubit_ptm(double *dm, double *ptm_g,  unsigned int bit, u
     int pos = high_x | x;
     int global_from = (pos & high_mask) | ((pos & 0x3) << (2*bit)) | ((pos & low_mask)>>2);
 
-    extern __shared__ double ptm[];
-    double *data = &ptm[16]; //need blockDim.x double floats
+    extern __shared__ REAL ptm[];
+    REAL *data = &ptm[16]; //need blockDim.x floats
 
     //first fetch the transfer matrix to shared memory
     if(x < 16) ptm[x] = ptm_g[x];
@@ -185,7 +249,7 @@ __global__ void single_qubit_ptm(double *dm, double *ptm_g,  unsigned int bit, u
     int row = x & 0x3;
     int idx = x & ~0x3;
 
-    double acc = 0;
+    REAL acc = 0;
 
     acc += ptm[4*row    ] * data[idx    ];
     acc += ptm[4*row + 1] * data[idx + 1];
@@ -197,15 +261,27 @@ __global__ void single_qubit_ptm(double *dm, double *ptm_g,  unsigned int bit, u
     dm[global_from] = acc;
 }
 
+__global__ void single_qubit_ptm(REAL *dm, REAL *ptm_g,  unsigned int bit, unsigned int no_qubits) {
+    single_qubit_ptm_body(dm, ptm_g, bit, no_qubits);
+}
+
+// when compiled with -DSINGLE_QUBIT_PTM_BIT=<bit>, the bit is a compile time
+// constant, so that the masks and shifts are folded by the compiler
+#ifdef SINGLE_QUBIT_PTM_BIT
+__global__ void single_qubit_ptm_fixed_bit(REAL *dm, REAL *ptm_g, unsigned int no_qubits) {
+    single_qubit_ptm_body(dm, ptm_g, SINGLE_QUBIT_PTM_BIT, no_qubits);
+}
+#endif
+
 
-__global__ void two_qubit_ptm(double *dm, double *ptm_g, unsigned int bit0, unsigned int bit1, unsigned int no_qubits) {
+__global__ void two_qubit_ptm(REAL *dm, REAL *ptm_g, unsigned int bit0, unsigned int bit1, unsigned int no_qubits) {
     const unsigned int x = threadIdx.x;
     const unsigned int high_x = blockIdx.x * blockDim.x;
 
 
 
-    extern __shared__ double ptm[];
-    double *data = &ptm[256]; //need blockDim.x double floats
+    extern __shared__ REAL ptm[];
+    REAL *data = &ptm[256]; //need blockDim.x floats
 
     // the lowest to bits of x are used to address bit0, the next two are used to address bit1 
     // global address = <- pos = 
@@ -242,7 +318,7 @@ __global__ void two_qubit_ptm(double *dm, double *ptm_g, unsigned int bit0, unsi
     unsigned int row = x & 0xf;
     unsigned int idx = x & ~0xf;
 
-    double acc=0;
+    REAL acc=0;
     for(int i=0; i<16; i++) {
         acc += ptm[16*row + i]*data[idx+i];
     }
@@ -256,7 +332,7 @@ __global__ void two_qubit_ptm(double *dm, double *ptm_g, unsigned int bit0, unsi
 
 //copy the two diagonal blocks of one ancilla into reduced density matrices
 //the qubit index is passed as an integer, not as a bitmask!
-__global__ void dm_reduce(double *dm, unsigned int bit, double *dm0, unsigned int state,
+__global__ void dm_reduce(REAL *dm, unsigned int bit, REAL *dm0, unsigned int state,
         unsigned int no_qubits) {
 
     const int addr = blockIdx.x*blockDim.x + threadIdx.x;
@@ -277,7 +353,7 @@ __global__ void dm_reduce(double *dm, unsigned int bit, double *dm0, unsigned in
 //copy the diagonal elements to out, in order to do effective 
 //calculation of subtraces.
 //run over a 1x9 grid!
-__global__ void get_diag(double *dm9, double *out, unsigned int no_qubits) {
+__global__ void get_diag(REAL *dm9, REAL *out, unsigned int no_qubits) {
     int x = (blockIdx.x *blockDim.x) + threadIdx.x;
 
     if (x >= (1 << no_qubits)) return;
@@ -289,10 +365,10 @@ __global__ void get_diag(double *dm9, double *out, unsigned int no_qubits) {
 }
 
 //trace kernel. Calculate the sum of a diagonal, must run in one block!
-//shared memory: 2**no_qubits doubles
+//shared memory: 2**no_qubits REALs
 //if bit is positive or zero, diag[0] and diag[1] will hold the partial traces of this bit being one/zero (!note the switch)
 //if bit is -1, diag[0] will hold the full trace.
-__global__ void trace(double *diag, int bit) { 
+__global__ void trace(REAL *diag, int bit) { 
     unsigned int x = threadIdx.x;
     unsigned int mask = 0;
 
@@ -300,11 +376,11 @@ __global__ void trace(double *diag, int bit) {
         mask = 1 << bit;
     }
 
-    extern __shared__ double s_diag[];
+    extern __shared__ REAL s_diag[];
     s_diag[x] = diag[x];
     __syncthreads(); 
 
-    double a;
+    REAL a;
 
     for(unsigned int i=1; i < blockDim.x; i <<= 1) {
         if(i != mask && i <= x) { 
@@ -333,7 +409,7 @@ __global__ void trace(double *diag, int bit) {
 //swap kernel
 //exchange two qubits. The only purpose of this kernel is to arrange a certain qubit as to be the most significant so that
 //projection is trivial. Actual swap gates should be implemented by relabeling!
-__global__ void swap(double *dm, unsigned int bit1, unsigned int bit2, unsigned int no_qubits) {
+__global__ void swap(REAL *dm, unsigned int bit1, unsigned int bit2, unsigned int no_qubits) {
     unsigned int addr = threadIdx.x + blockDim.x*blockIdx.x;
 
     if (addr >= (1<<2*no_qubits)) return;
@@ -345,7 +421,7 @@ __global__ void swap(double *dm, unsigned int bit1, unsigned int bit2, unsigned
         ((addr & bit1_mask) << (2*(bit2 - bit1))) |
         ((addr & bit2_mask) >> (2*(bit2 - bit1)));
    
-    double t;
+    REAL t;
     if (addr > addr2) {
         t = dm[addr2];
         dm[addr2] = dm[addr];
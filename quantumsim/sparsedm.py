@@ -138,8 +138,6 @@ class SparseDM:
         classical_bits = {bit: self.classical[bit]
                           for bit in bits if bit in self.classical}
 
-        res = [(classical_bits, self.full_dm.copy())]
-
         bits = [bit for bit in bits if bit not in self.classical]
 
         # commented out because apparently unused...
@@ -170,6 +168,48 @@ class SparseDM:
 
         return res
 
+    def sample_multiple_measurements(self, bits, n_shots, rng=None):
+        """Sample `n_shots` outcomes of a measurement of all the given bits, without
+        changing the state of the system.
+
+        The probabilities of all outcomes (see peak_multiple_measurements) are calculated once,
+        and the shots are drawn from their cumulative distribution by binary search.
+        This is much cheaper than applying a circuit with measurements for every shot,
+        but only valid if nothing in the circuit depends on the measurement results.
+
+        rng: a np.random.RandomState to draw the shots from, or a seed for a new one.
+             If None, a new RandomState is seeded from the operating system.
+
+        Return a list of tuples of the form
+
+        [(result, count), ...]
+
+        where `result` is a dict describing the measurement result {"bit0": 1, "bit2": 0, ...},
+        and `count` is the number of shots with that result. Results that were never drawn are omitted.
+        """
+        if not isinstance(rng, np.random.RandomState):
+            rng = np.random.RandomState(rng)
+
+        outcomes = self.peak_multiple_measurements(bits)
+
+        # rounding errors can make probabilities slightly negative,
+        # which would break the monotonicity of the cdf
+        probs = np.clip([prob for outcome, prob in outcomes], 0, None)
+        cdf = np.cumsum(probs)
+        if not cdf[-1] > 1e-12:
+            raise ValueError("cannot sample measurements from a state with total probability %g"
+                             % cdf[-1])
+
+        rs = rng.random_sample(n_shots) * cdf[-1]
+        idx = np.searchsorted(cdf, rs, side="right")
+        # rs can round up to cdf[-1], which would be past the last outcome
+        np.minimum(idx, len(outcomes) - 1, out=idx)
+        counts = np.bincount(idx, minlength=len(outcomes))
+        assert counts.sum() == n_shots
+
+        return [(outcome, int(count)) for (outcome, prob), count in zip(outcomes, counts)
+                if count > 0]
+
     def trace(self):
         """Return the trace of the density matrix, which is the probability for all measurement projections in its history.
         """
@@ -0,0 +1,8 @@
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "gpu: tests running on the pycuda backend (deselect with -m \"not gpu\")")
+    # provided by pytest-xdist when installed; registered here so that the
+    # marks do not warn without it
+    config.addinivalue_line(
+        "markers", "xdist_group(name): run all tests of the group on one xdist worker "
+        "(with --dist=loadgroup)")
@@ -1,5 +1,6 @@
 import quantumsim.circuit as circuit
 import quantumsim.ptm as ptm
+import quantumsim.sparsedm as sparsedm
 from unittest.mock import MagicMock, patch, call, ANY
 import numpy as np
 import pytest
@@ -254,6 +255,124 @@ class TestCircuit:
         assert {g.time for g in c.gates} == {0, 5, 10, 15}
         assert {g.involved_qubits[0] for g in c.gates} == {'Q', 'A'}
 
+    def test_add_subcircuit_renamed_gates_involve_new_qubit(self):
+        c = circuit.Circuit()
+        subc = circuit.Circuit()
+
+        subc.add_qubit('A')
+        subc.add_hadamard("A", 0)
+        assert subc.gates[0].involves_qubit("A")
+
+        c.add_qubit('Q')
+        c.add_subcircuit(subc, time=0, name_map={'A': 'Q'})
+
+        assert c.gates[0].involves_qubit("Q")
+        assert not c.gates[0].involves_qubit("A")
+        assert subc.gates[0].involves_qubit("A")
+
+
+class TestCombineSingleQubitGates:
+
+    def test_combine_runs(self):
+        c = circuit.Circuit()
+        c.add_qubit("A")
+        c.add_qubit("B")
+
+        c.add_gate(circuit.Hadamard("A", time=0))
+        c.add_gate(circuit.RotateY("A", time=1, angle=0.3))
+        c.add_gate(circuit.Hadamard("B", time=1))
+        c.add_gate(circuit.CPhase("A", "B", time=2))
+        c.add_gate(circuit.RotateX("A", time=3, angle=0.2))
+
+        c.order()
+        c.combine_single_qubit_gates()
+
+        assert len(c.gates) == 4
+        assert isinstance(c.gates[-1], circuit.RotateX)
+
+        fused = [g for g in c.gates if g.involved_qubits == ["A"]][0]
+        assert fused.time == 1
+        assert np.allclose(fused.ptm,
+                           ptm.rotate_y_ptm(0.3).dot(ptm.hadamard_ptm()))
+
+    def test_same_result(self):
+        def make_circuit():
+            c = circuit.Circuit()
+            c.add_qubit("A")
+            c.add_qubit("B")
+            c.add_gate(circuit.RotateY("A", time=0, angle=0.4))
+            c.add_gate(circuit.RotateX("A", time=1, angle=1.1))
+            c.add_gate(circuit.CPhase("A", "B", time=2))
+            c.add_gate(circuit.Hadamard("B", time=3))
+            c.add_gate(circuit.RotateZ("B", time=4, angle=0.7))
+            c.order()
+            return c
+
+        c1 = make_circuit()
+        c2 = make_circuit()
+        c2.combine_single_qubit_gates()
+        assert len(c2.gates) == 3
+
+        sdm1 = sparsedm.SparseDM(["A", "B"])
+        sdm2 = sparsedm.SparseDM(["A", "B"])
+        c1.apply_to(sdm1)
+        c2.apply_to(sdm2)
+
+        assert np.allclose(sdm1.full_dm.to_array(), sdm2.full_dm.to_array())
+
+
+class TestAbsorbSingleQubitGates:
+
+    def test_absorb_into_cphase(self):
+        c = circuit.Circuit()
+        c.add_qubit("A")
+        c.add_qubit("B")
+
+        c.add_gate(circuit.Hadamard("A", time=0))
+        c.add_gate(circuit.CPhase("A", "B", time=1))
+        c.add_gate(circuit.RotateY("B", time=2, angle=0.3))
+        c.add_gate(circuit.Measurement("B", time=3, sampler=None))
+        c.add_gate(circuit.RotateX("B", time=4, angle=0.2))
+
+        c.order()
+        c.absorb_single_qubit_gates()
+
+        assert len(c.gates) == 4
+        assert isinstance(c.gates[1], circuit.TwoPTMGate)
+        assert c.gates[1].time == 1
+        assert isinstance(c.gates[-1], circuit.RotateX)
+
+        cphase_ptm = ptm.double_kraus_to_ptm(np.diag([1, 1, 1, -1]))
+        assert np.allclose(
+            c.gates[1].two_ptm,
+            np.kron(ptm.rotate_y_ptm(0.3), np.eye(4)).dot(cphase_ptm))
+
+    def test_same_result(self):
+        def make_circuit():
+            c = circuit.Circuit()
+            c.add_qubit("A")
+            c.add_qubit("B")
+            c.add_gate(circuit.RotateY("A", time=0, angle=0.4))
+            c.add_gate(circuit.CPhase("A", "B", time=1))
+            c.add_gate(circuit.RotateX("A", time=2, angle=1.1))
+            c.add_gate(circuit.Hadamard("B", time=2))
+            c.add_gate(circuit.CNOT("B", "A", time=3))
+            c.add_gate(circuit.RotateZ("B", time=4, angle=0.7))
+            c.order()
+            return c
+
+        c1 = make_circuit()
+        c2 = make_circuit()
+        c2.absorb_single_qubit_gates()
+        assert len(c2.gates) == 3
+
+        sdm1 = sparsedm.SparseDM(["A", "B"])
+        sdm2 = sparsedm.SparseDM(["A", "B"])
+        c1.apply_to(sdm1)
+        c2.apply_to(sdm2)
+
+        assert np.allclose(sdm1.full_dm.to_array(), sdm2.full_dm.to_array())
+
 
 class TestVariableQubits:
     def test_add_gates(self):
@@ -389,6 +508,16 @@ class TestAmpPhDamping:
 
         sdm.apply_ptm.assert_called_once_with("A", ptm=ANY)
 
+    def test_apply_zero_duration(self):
+        sdm = MagicMock()
+        sdm.apply_ptm = MagicMock()
+
+        apd = circuit.AmpPhDamp("A", 0, 0, 10, 5)
+
+        apd.apply_to(sdm)
+
+        sdm.apply_ptm.assert_not_called()
+
 
 class TestMeasurement:
 
@@ -433,7 +562,7 @@ class TestMeasurement:
 
         assert m.measurements == [1]
 
-        sdm.peak_measurement.assert_called_once_with("A")
+        sdm.peak_measurement.assert_not_called()
         sdm.project_measurement.assert_called_once_with("A", 1)
 
         sdm.peak_measurement = MagicMock(return_value=(1, 0))
@@ -443,7 +572,7 @@ class TestMeasurement:
 
         assert m.measurements == [1, 1]
 
-        sdm.peak_measurement.assert_called_once_with("A")
+        sdm.peak_measurement.assert_not_called()
         sdm.project_measurement.assert_called_once_with("A", 1)
 
     def test_apply_random(self):
@@ -452,9 +581,9 @@ class TestMeasurement:
         with patch('numpy.random.RandomState') as rsclass:
             rs = MagicMock()
             rsclass.return_value = rs
-            rs.random_sample = MagicMock()
-            p = rs.random_sample
-            p.return_value = 0.3
+            # the sampler draws its random numbers in batches
+            rs.random_sample = MagicMock(
+                side_effect=lambda size: np.array([0.3, 0.7] + [0.5] * (size - 2)))
             sdm = MagicMock()
             sdm.peak_measurement = MagicMock(return_value=(0.06, 0.04))
             sdm.project_measurement = MagicMock()
@@ -465,7 +594,6 @@ class TestMeasurement:
 
             sdm.peak_measurement = MagicMock(return_value=(0.06, 0.04))
             sdm.project_measurement = MagicMock()
-            p.return_value = 0.7
 
             m.apply_to(sdm)
 
@@ -520,6 +648,15 @@ class TestMeasurement:
 
 class TestConditionalGates:
 
+    def test_all_involved_qubits(self):
+        g = circuit.ConditionalGate(
+            time=0, control_bit="C",
+            zero_gates=[circuit.Hadamard("A", 0)],
+            one_gates=[circuit.CPhase("A", "B", 0)])
+
+        assert g.all_involved_qubits() == {"A", "B", "C"}
+        assert all(g.involves_qubit(b) for b in "ABC")
+
     @pytest.mark.skip()
     def test_simple(self):
         sdm = MagicMock()
@@ -560,7 +697,8 @@ class TestSamplers:
         with patch("numpy.random.RandomState") as rsclass:
             rs = MagicMock()
             rsclass.return_value = rs
-            rs.random_sample = MagicMock(return_value=0.5)
+            rs.random_sample = MagicMock(
+                side_effect=lambda size: np.full(size, 0.5))
 
             s = circuit.uniform_sampler(seed=42)
             next(s)
@@ -573,11 +711,20 @@ class TestSamplers:
                 assert prob == 1
                 assert proj == int(p0 < 0.5)
 
+    def test_uniform_sampler_same_stream_as_unbatched(self):
+        s = circuit.uniform_sampler(seed=42)
+        next(s)
+        rng = np.random.RandomState(42)
+        for _ in range(2000):
+            proj, dec, prob = s.send((0.5, 0.5))
+            assert proj == int(rng.random_sample() >= 0.5)
+
     def test_uniform_noisy_sampler(self):
         with patch("numpy.random.RandomState") as rsclass:
             rs = MagicMock()
             rsclass.return_value = rs
-            rs.random_sample = MagicMock(return_value=0.5)
+            rs.random_sample = MagicMock(
+                side_effect=lambda size: np.full(size, 0.5))
 
             s = circuit.uniform_noisy_sampler(0.4, seed=42)
             next(s)
@@ -1,24 +1,110 @@
+import collections
+import functools
+
 import numpy as np
 import pytest
 
 import quantumsim.dm_np as dm_np
+import quantumsim.ptm as ptm
 
 # There are two implementations for the backend (on CPU and on GPU)
 # here we collect the classes we want to test
 
+# The GPU backend is marked "gpu", so that it can be deselected with -m "not gpu".
+# Each backend also gets its own xdist_group, so that with pytest-xdist and
+# --dist=loadgroup all tests of one backend run on the same worker (sharing the
+# session fixtures and a single CUDA context), while the backends run in parallel.
+
 implementations_to_test = []
-implementations_to_test.append(dm_np.DensityNP)
+implementations_to_test.append(pytest.param(
+    dm_np.DensityNP, id="cpu", marks=pytest.mark.xdist_group(name="cpu")))
 
 hascuda = False
 try:
     import pycuda.gpuarray as ga
     import quantumsim.dm10 as dm10
-    implementations_to_test.append(dm10.Density)
+    implementations_to_test.append(
+        pytest.param(dm10.Density, id="gpu",
+                     marks=[pytest.mark.gpu, pytest.mark.xdist_group(name="gpu")]))
     hascuda = True
 except ImportError:
     pass
 # We automatically only test the backends available by using the fixtures here
 
+# diagonal of the five-qubit ground state
+_GS_DIAG_N5 = np.zeros(2**5)
+_GS_DIAG_N5[0] = 1
+_GS_DIAG_N5.setflags(write=False)
+
+# density matrix of two qubits both in the excited state, |11><11|
+_EXCITED_N2 = np.zeros((4, 4))
+_EXCITED_N2[3, 3] = 1
+_EXCITED_N2.setflags(write=False)
+
+# scratch space for the random matrices of up to 7 qubits, as interleaved
+# (real, imag) pairs, so that it can be viewed as a complex128 array
+_SCRATCH = np.empty(2 * 4**7)
+
+
+def _random_matrix(n):
+    """Return a random complex (2**n, 2**n) matrix, with real and imaginary
+    parts uniform in [0, 1) (so that the trace of its hermitian part is positive).
+
+    The generator is seeded with n on every call, so that a test gets the same matrix
+    in every run, no matter which other tests run before it (e.g. with -k or xdist).
+
+    The matrix is a view of the module scratch space, and is overwritten by the next
+    call: copy it if it has to be kept.
+    """
+    floats = _SCRATCH[:2 * 4**n]
+    np.random.default_rng((0xC0FFEE, n)).random(out=floats)
+    return floats.view(np.complex128).reshape(2**n, 2**n)
+
+
+def _hermitize_inplace(a):
+    """Replace the square complex matrix a by a + a^dagger, without a complex temporary."""
+    a.real += a.real.T
+    a.imag -= a.imag.T
+
+
+def _random_density_matrix(n):
+    """Return a random hermitian (2**n, 2**n) matrix with trace one.
+
+    Like _random_matrix, this is a view of the module scratch space.
+    """
+    a = _random_matrix(n)
+    # the trace of a + a^dagger is twice the real trace of a, and real
+    trace = 2 * a.real.trace()
+    _hermitize_inplace(a)
+    a /= trace
+    return a
+
+
+def _close(a, b, rtol=1e-05, atol=1e-08):
+    """np.allclose for two (possibly complex) scalars, without creating arrays:
+    |a - b| <= atol + rtol * |b|, with b as the reference value.
+    """
+    return abs(a - b) <= atol + rtol * abs(b)
+
+
+@functools.lru_cache(maxsize=None)
+def _gs(n):
+    """Return the (read-only) array of the n-qubit ground state |0...0><0...0|.
+
+    Only used as a reference to compare with: creating a Density(n) without data
+    is cheaper than converting this array.
+    """
+    a = np.zeros((2**n, 2**n), np.complex128)
+    a[0, 0] = 1
+    a.setflags(write=False)
+    return a
+
+
+def _max_abs_diff(a, b):
+    """Return the largest absolute difference between the entries of a and b."""
+    diff = np.subtract(a, b)
+    return np.abs(diff).max()
+
 
 @pytest.fixture(params=implementations_to_test)
 def dm(request):
@@ -30,25 +116,22 @@ def dmclass(request):
     return request.param
 
 
-@pytest.fixture(params=implementations_to_test)
-def dm_random(request):
+@pytest.fixture(params=implementations_to_test, scope="module")
+def dm_random_factory(request):
+    # the random matrix is built once per backend, every test gets a fresh density matrix
     n = 5
-    a = np.random.random((2**n, 2**n)) * 1j
-    a += np.random.random((2**n, 2**n))
+    a = _random_density_matrix(n).copy()
+    return lambda: request.param(n, a.copy())
 
-    a += a.transpose().conj()
-    a = a / np.trace(a)
-    dm = request.param(n, a)
-    return dm
+
+@pytest.fixture
+def dm_random(dm_random_factory):
+    return dm_random_factory()
 
 @pytest.fixture(params=implementations_to_test)
 def dm_random_small(request):
     n = 2
-    a = np.random.random((2**n, 2**n)) * 1j
-    a += np.random.random((2**n, 2**n))
-
-    a += a.transpose().conj()
-    a = a / np.trace(a)
+    a = _random_density_matrix(n)
     dm = request.param(n, a)
     return dm
 
@@ -70,29 +153,43 @@ class TestDensityInit:
 
     def test_numpy_array(self, dmclass):
         n = 5
-        a = np.random.random((2**n, 2**n)) * 1j
-        a += np.random.random((2**n, 2**n))
-
-        a += a.transpose().conj()
-        a = a / np.trace(a)
+        a = _random_density_matrix(n)
         dm = dmclass(n, a)
         assert dm.no_qubits == n
         assert np.allclose(dm.to_array(), a)
 
     @pytest.mark.skipif(not hascuda, reason="pycuda not installed")
     def test_gpu_array(self):
-        n = 10
-        a = ga.zeros(2**(2 * n), dtype=np.float64)
+        # only the buffer is wrapped, its contents are never read
+        n = 2
+        a = ga.empty(2**(2 * n), dtype=np.float64)
         dm = dm10.Density(n, a)
         assert a.gpudata is dm.data.gpudata
 
+    @pytest.mark.skipif(not hascuda, reason="pycuda not installed")
+    def test_single_precision(self):
+        n = 5
+        a = _random_density_matrix(n)
+        dm = dm10.Density(n, a, dtype=np.float32)
+        assert dm.data.dtype == np.float32
+
+        dm.rotate_y(1, np.pi / 3)
+        dm.add_ancilla(0)
+        dm2 = dm10.Density(n, a)
+        dm2.rotate_y(1, np.pi / 3)
+        dm2.add_ancilla(0)
+
+        assert np.allclose(dm.to_array(), dm2.to_array(), atol=1e-6)
+        assert _close(dm.trace(), 1, atol=1e-5)
+
     def test_wrong_data(self, dmclass):
         with pytest.raises(ValueError):
             dmclass(10, "bla")
 
     def test_wrong_size(self, dmclass):
         n = 10
-        a = np.zeros((2**n, 2**n))
+        # only the shape is checked, so a zero-strided view without memory is enough
+        a = np.broadcast_to(np.float64(0.0), (2**n, 2**n))
         with pytest.raises(AssertionError):
             dmclass(n + 1, a)
 
@@ -100,20 +197,19 @@ class TestDensityInit:
 class TestDensityTrace:
 
     def test_empty_trace_one(self, dm):
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
 
     def test_trace_random(self, dmclass):
         n = 5
-        a = np.random.random((2**n, 2**n)) * 1j
-        a += np.random.random((2**n, 2**n))
-        a += a.transpose().conj()
+        a = _random_matrix(n)
+        _hermitize_inplace(a)
 
         dm = dmclass(n, a)
 
         trace_dm = dm.trace()
         trace_np = a.trace()
 
-        assert np.allclose(trace_dm, trace_np)
+        assert _close(trace_dm, trace_np)
 
 
 class TestCopy:
@@ -132,17 +228,14 @@ class TestDensityGetDiag:
 
     def test_empty_trace_one(self, dm):
         diag = dm.get_diag()
-        diag_should = np.zeros(2**5)
-        diag_should[0] = 1
-        assert np.allclose(diag, diag_should)
+        assert np.allclose(diag, _GS_DIAG_N5)
 
     def test_trace_random(self, dmclass):
         n = 7
-        a = np.random.random((2**n, 2**n)) * 1j
-        a += np.random.random((2**n, 2**n))
+        a = _random_matrix(n)
 
         # make a hermitian
-        a += a.transpose().conj()
+        _hermitize_inplace(a)
         dm = dmclass(n, a)
 
         diag_dm = dm.get_diag()
@@ -154,16 +247,15 @@ class TestDensityGetDiag:
 class TestRenormalize:
 
     def test_renormalize_does_nothing_to_gs(self, dm):
-        a0 = dm.to_array()
+        a0 = _gs(5)
         dm.renormalize()
         a1 = dm.to_array()
         assert np.allclose(a0, a1)
 
     def test_random_matrix(self, dmclass):
         n = 6
-        a = np.random.random((2**n, 2**n)) * 1j
-        a += np.random.random((2**n, 2**n))
-        a += a.transpose().conj()
+        a = _random_matrix(n)
+        _hermitize_inplace(a)
         dm = dmclass(n, a)
 
         dm.renormalize()
@@ -171,8 +263,9 @@ class TestRenormalize:
 
         a2 = dm.to_array()
 
-        assert np.allclose(tr, 1)
-        assert np.allclose(a2, a / np.trace(a))
+        assert abs(tr - 1) < 1e-10
+        a /= np.trace(a)
+        assert np.linalg.norm(a2 - a) < 1e-8 * np.linalg.norm(a)
 
 class TestDensityCPhase:
 
@@ -181,38 +274,37 @@ class TestDensityCPhase:
             dm.cphase(10, 11)
 
     def test_does_nothing_to_ground_state(self, dm):
-        a0 = dm.to_array()
+        a0 = _gs(5)
         dm.cphase(4, 3)
-        a1 = dm.to_array()
-        assert np.allclose(a0, a1)
+        assert _max_abs_diff(dm.to_array(), a0) < 1e-8
 
     def test_does_something_to_random_state(self, dm_random):
         dm = dm_random
         a0 = dm.to_array()
         dm.cphase(4, 3)
         a1 = dm.to_array()
-        assert np.allclose(np.trace(a0), np.trace(a1))
-        assert not np.allclose(a0, a1)
+        assert _close(np.trace(a0), np.trace(a1))
+        assert _max_abs_diff(a1, a0) > 1e-8
 
     def test_preserve_trace_empty(self, dm_random):
         dm = dm_random
         dm.cphase(2, 1)
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
         dm.cphase(2, 3)
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
         dm.cphase(4, 3)
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
 
     def test_preserve_trace_small(self, dm_random_small):
         dm = dm_random_small
         dm.cphase(0, 1)
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
 
     def test_preserve_trace_regression(self, dmclass):
         dm = dmclass(2)
         dm.hadamard(0)
         dm.cphase(0, 1)
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
 
     def test_squares_to_one(self, dm_random):
         dm = dm_random
@@ -221,8 +313,7 @@ class TestDensityCPhase:
         dm.cphase(4, 0)
         dm.cphase(2, 1)
         dm.cphase(4, 0)
-        a1 = dm.to_array()
-        assert np.allclose(a0, a1)
+        assert _max_abs_diff(dm.to_array(), a0) < 1e-8
 
 class TestDensityHadamard:
 
@@ -231,18 +322,17 @@ class TestDensityHadamard:
             dm.hadamard(10)
 
     def test_does_something_to_ground_state(self, dm):
-        a0 = dm.to_array()
+        a0 = _gs(5)
         dm.hadamard(4)
-        a1 = dm.to_array()
-        assert not np.allclose(a0, a1)
+        assert _max_abs_diff(dm.to_array(), a0) > 1e-8
 
     def test_preserve_trace_ground_state(self, dm):
         dm.hadamard(2)
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
         dm.hadamard(4)
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
         dm.hadamard(0)
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
 
     # @pytest.mark.skip
     # def test_squares_to_one(self, dm_random):
@@ -259,20 +349,18 @@ class TestDensityHadamard:
 
     def test_squares_to_one_small(self, dmclass):
         dm = dmclass(1)
-        print(dm.to_array())
 
         dm.hadamard(0)
-        print(dm.to_array())
         dm.hadamard(0)
 
-        print(dm.to_array())
-
-        assert dm.to_array()[0, 0] == 1
+        a1 = dm.to_array()
+        assert a1[0, 0] == 1
+        assert _max_abs_diff(a1, _gs(1)) < 1e-8
 
 class TestCnot:
     def test_cnot(self, dmclass):
         dm = dmclass(2)
-        a = dm.to_array()
+        a = _gs(2)
         dm.hadamard(1)
         dm.cphase(0, 1)
         dm.hadamard(1)
@@ -285,8 +373,7 @@ class TestDensityRotateX:
             dm.rotate_x(10, 2.3)
 
     def test_does_something_to_ground_state(self, dm):
-        a0 = dm.to_array()
-        dm.rotate_x(4, 2.3) 
+        dm.rotate_x(4, 2.3)
 
     def test_excite(self, dmclass):
         dm = dmclass(2)
@@ -294,19 +381,17 @@ class TestDensityRotateX:
         dm.rotate_x(0, np.pi)
         dm.rotate_x(1, np.pi)
 
-        a1 = dm.to_array()
-        assert np.allclose(np.trace(a1), 1)
-        assert np.allclose(a1[-1, -1], 1)
+        assert _max_abs_diff(dm.to_array(), _EXCITED_N2) < 1e-8
 
     def test_preserves_trace(self, dm_random):
 
-        assert np.allclose(dm_random.trace(), 1)
+        assert _close(dm_random.trace(), 1)
         dm_random.rotate_x(2, 2.3)
-        assert np.allclose(dm_random.trace(), 1)
+        assert _close(dm_random.trace(), 1)
 
     def test_cubes_to_one(self, dmclass):
         dm = dmclass(1)
-        a0 = dm.to_array()
+        a0 = _gs(1)
         dm.rotate_x(0, 2*np.pi/3)
         dm.rotate_x(0, 2*np.pi/3)
         dm.rotate_x(0, 2*np.pi/3)
@@ -321,7 +406,7 @@ class TestDensityRotateY:
             dm.rotate_y(10, 2.3)
 
     def test_does_something_to_ground_state(self, dm):
-        a0 = dm.to_array()
+        a0 = _gs(5)
         dm.rotate_y(4, 2.3)
         a1 = dm.to_array()
         assert not np.allclose(a0, a1)
@@ -331,12 +416,10 @@ class TestDensityRotateY:
         dm.rotate_y(0, np.pi)
         dm.rotate_y(1, np.pi)
 
-        a1 = dm.to_array()
-        assert np.allclose(np.trace(a1), 1)
-        assert np.allclose(a1[-1, -1], 1)
+        assert _max_abs_diff(dm.to_array(), _EXCITED_N2) < 1e-8
 
     def test_cubes_to_one(self, dm):
-        a0 = dm.to_array()
+        a0 = _gs(5)
         dm.rotate_y(1, 2*np.pi /3 )
         dm.rotate_y(1, 2*np.pi /3 )
         dm.rotate_y(1, 2*np.pi /3 )
@@ -351,7 +434,7 @@ class TestDensityRotateZ:
             dm.rotate_z(10, 2.3)
 
     def test_does_nothing_to_ground_state(self, dm):
-        a0 = dm.to_array()
+        a0 = _gs(5)
         dm.rotate_z(4, 2.3)
         a1 = dm.to_array()
         assert np.allclose(a0, a1)
@@ -367,14 +450,12 @@ class TestDensityRotateZ:
         dm.rotate_z(1, np.pi)
         dm.hadamard(1)
 
-        a1 = dm.to_array()
-        assert np.allclose(np.trace(a1), 1)
-        assert np.allclose(a1[-1, -1], 1)
+        assert _max_abs_diff(dm.to_array(), _EXCITED_N2) < 1e-8
 
     def test_cubes_to_one(self, dmclass):
         dm = dmclass(1)
 
-        a0 = dm.to_array()
+        a0 = _gs(1)
 
         dm.hadamard(0)
         dm.rotate_z(0, 2*np.pi/3)
@@ -389,7 +470,7 @@ class TestDensityRotateZ:
 class TestCommutationXYZ:
 
     def test_excite_deexcite(self, dm):
-        a0 = dm.to_array()
+        a0 = _gs(5)
         dm.rotate_x(1, np.pi)
         dm.rotate_y(1, np.pi)
         dm.rotate_z(1, np.pi)
@@ -400,7 +481,7 @@ class TestCommutationXYZ:
         assert np.allclose(a0, a1)
 
     def test_pauli_xyz(self, dm):
-        a0 = dm.to_array()
+        a0 = _gs(5)
 
         dm.rotate_x(1, np.pi/2)
         dm.rotate_z(1, np.pi/2)
@@ -412,7 +493,7 @@ class TestCommutationXYZ:
 
     def test_xyx(self, dm):
 
-        a0 = dm.to_array()
+        a0 = _gs(5)
 
         dm.rotate_x(1, np.pi/2)
         dm.rotate_y(1, np.pi/2)
@@ -428,32 +509,30 @@ class TestDensityAmpPhDamping:
             dm.amp_ph_damping(10, 0.0, 0.0)
 
     def test_does_nothing_to_ground_state(self, dm):
-        a0 = dm.to_array()
+        a0 = _gs(5)
         dm.amp_ph_damping(4, 0.5, 0.5)
         a1 = dm.to_array()
         assert np.allclose(a0, a1)
 
     def test_preserve_trace_random_state(self, dm_random):
         dm = dm_random
-        dm.amp_ph_damping(4, 0.5, 0.5)
-        assert np.allclose(dm.trace(), 1)
-        dm.amp_ph_damping(2, 0.5, 0.5)
-        assert np.allclose(dm.trace(), 1)
-        dm.amp_ph_damping(1, 0.5, 0.5)
-        assert np.allclose(dm.trace(), 1)
+        # damping is trace preserving, so checking once after all of them is enough
+        for bit in [4, 2, 1]:
+            dm.amp_ph_damping(bit, 0.5, 0.5)
+        assert _close(dm.trace(), 1)
 
     def test_strong_damping_gives_ground_state(self, dm_random):
         dm = dm_random
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
 
         for bit in range(dm.no_qubits):
             dm.amp_ph_damping(bit, 1.0, 0.0)
 
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
 
         a2 = dm.to_array()
 
-        assert np.allclose(a2[0, 0], 1)
+        assert _close(a2[0, 0], 1)
 
 class TestDensityAddAncilla:
 
@@ -462,23 +541,21 @@ class TestDensityAddAncilla:
         dm = dmclass(9)
         dm.add_ancilla(0)
         assert dm.no_qubits == 10
-        assert np.allclose(dm.trace(), 1)
-        a = dm.to_array()
-        assert np.allclose(a[0, 0], 1)
+        assert _close(dm.trace(), 1)
+        assert _close(dm.get_diag()[0], 1)
 
     def test_add_exc_ancilla_to_gs_gives_no_gs(self, dm):
         old_no_qubits = dm.no_qubits
         dm.add_ancilla(1)
         assert dm.no_qubits == old_no_qubits + 1
-        assert np.allclose(dm.trace(), 1)
-        a = dm.to_array()
-        assert np.allclose(a[0, 0], 0)
+        assert _close(dm.trace(), 1)
+        assert _close(dm.get_diag()[0], 0)
 
     def test_preserve_trace_random_state(self, dm_random):
         dm = dm_random
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
         dm.add_ancilla(1)
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
 
     def test_add_then_project_exc(self, dm_random):
         a = dm_random.to_array()
@@ -512,28 +589,28 @@ class TestDensityAddAncilla:
         dm.add_ancilla(1)
 
         assert dm.no_qubits == 5
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
 
         # 01234
         # 10101
         print("{:05b}".format(np.argmax(dm.get_diag())))
         dm.project_measurement(2, 1)
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
         # 1010
         print("{:05b}".format(np.argmax(dm.get_diag())))
         dm.project_measurement(3, 0)
         # 101
         print("{:05b}".format(np.argmax(dm.get_diag())))
         dm.project_measurement(1, 0)
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
         # 11
         print("{:05b}".format(np.argmax(dm.get_diag())))
         dm.project_measurement(1, 1)
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
         # 1
         print("{:05b}".format(np.argmax(dm.get_diag())))
         dm.project_measurement(0, 1)
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
 
 class TestDensityProjectMeasurement:
     def test_bit_too_high(self, dm):
@@ -550,30 +627,28 @@ class TestDensityProjectMeasurement:
 
     def test_measure_on_gs_gives_gs(self, dm):
         dm.project_measurement(3, 0)
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
 
     def test_measure_1_on_gs_gives_0(self, dm):
         dm.project_measurement(3, 1)
-        assert np.allclose(dm.trace(), 0)
+        assert _close(dm.trace(), 0)
 
     def test_project_after_hadamard_gives_half(self, dm):
         dm.hadamard(3)
         dm.project_measurement(2, 0)
-        assert np.allclose(dm.trace(), 1)
+        assert _close(dm.trace(), 1)
         dm.project_measurement(3, 1)
-        assert np.allclose(dm.trace(), 0.5)
+        assert _close(dm.trace(), 0.5)
     def test_gs_always_gives_zero(self, dm):
         p0, p1 = dm.partial_trace(4)
 
-        assert np.allclose(p0, 1)
-        assert np.allclose(p1, 0)
+        assert np.allclose([p0, p1], [1, 0])
 
     def test_hadamard_gives_50_50(self, dm):
         dm.hadamard(4)
         p0, p1 = dm.partial_trace(4)
 
-        assert np.allclose(p0, 0.5)
-        assert np.allclose(p1, 0.5)
+        assert np.allclose([p0, p1], [0.5, 0.5])
 
     def test_hadamard_gives_50_50_on_small(self, dmclass):
         dm = dmclass(1)
@@ -581,20 +656,66 @@ class TestDensityProjectMeasurement:
         dm.hadamard(0)
         p0, p1 = dm.partial_trace(0)
 
-        assert np.allclose(p0, 0.5)
-        assert np.allclose(p1, 0.5)
+        assert np.allclose([p0, p1], [0.5, 0.5])
 
     def test_trace_preserve(self, dm_random):
         dm = dm_random
         p0, p1 = dm.partial_trace(2)
 
-        assert np.allclose(p0 + p1, 1)
+        assert _close(p0 + p1, 1)
 
     def test_relax_then_measure_gives_gs(self, dm_random):
         dm = dm_random
         dm.amp_ph_damping(2, 1.0, 1.0)
         p0, p1 = dm.partial_trace(2)
-        assert np.allclose(p1, 0)
-        assert np.allclose(p0, 1)
+        assert np.allclose([p0, p1], [1, 0])
 
 
+@pytest.mark.skipif(not hascuda, reason="pycuda not installed")
+class TestPTMCache:
+
+    def test_evict_from_small_cache(self, monkeypatch):
+        # a cache of its own, so that no PTMs of other tests are evicted (and freed)
+        monkeypatch.setattr(dm10.Density, "_ptm_cache", collections.OrderedDict())
+        monkeypatch.setattr(dm10.Density, "_ptm_cache_size", 2)
+        n = 3
+        a = _random_density_matrix(n)
+        dm = dm10.Density(n, a)
+        dm_ref = dm_np.DensityNP(n, a)
+
+        for bit, angle in [(0, 0.1), (1, 0.2), (2, 0.3), (0, 0.4), (1, 0.1)]:
+            p = ptm.rotate_x_ptm(angle)
+            dm.apply_ptm(bit, p)
+            dm_ref.apply_ptm(bit, p)
+            assert len(dm10.Density._ptm_cache) <= 2
+
+        assert _max_abs_diff(dm.to_array(), dm_ref.to_array()) < 1e-8
+
+    def test_reuse_evicted_ptm_memory(self, monkeypatch):
+        # evicted device buffers are reused for a PTM of the same shape only,
+        # so mix single and two-qubit PTMs
+        monkeypatch.setattr(dm10.Density, "_ptm_cache", collections.OrderedDict())
+        monkeypatch.setattr(dm10.Density, "_ptm_cache_size", 2)
+        n = 3
+        a = _random_density_matrix(n)
+        dm = dm10.Density(n, a)
+        dm_ref = dm_np.DensityNP(n, a)
+
+        for i, angle in enumerate([0.1, 0.2, 0.3, 0.4, 0.5, 0.6]):
+            if i % 3 == 2:
+                kraus = np.diag([1, 1, 1, np.exp(1j * angle)])
+                p = ptm.double_kraus_to_ptm(kraus).real
+                dm.apply_two_ptm(0, 2, p)
+                dm_ref.apply_two_ptm(0, 2, p)
+            else:
+                p = ptm.rotate_y_ptm(angle)
+                dm.apply_ptm(i % 3, p)
+                dm_ref.apply_ptm(i % 3, p)
+
+            assert len(dm10.Density._ptm_cache) <= 2
+            # the slot the PTM was stored in holds the new matrix
+            ptm_gpu = dm10.Density._ptm_cache[np.dtype(np.float64), hash(p.tobytes())]
+            assert ptm_gpu.shape == p.shape
+            assert np.allclose(ptm_gpu.get(), p)
+
+        assert _max_abs_diff(dm.to_array(), dm_ref.to_array()) < 1e-8
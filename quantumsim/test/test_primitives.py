@@ -11,11 +11,13 @@ try:
     import quantumsim.dm10 as dm10
 
     with open(dm10.kernel_file, "r") as f:
-        mod = SourceModule(f.read())
+        kernel_source = f.read()
+    mod = SourceModule(kernel_source)
 
     get_diag = mod.get_function("get_diag")
 
     bit_to_pauli_basis = mod.get_function("bit_to_pauli_basis")
+    bit_to_pauli_basis_tile = mod.get_function("bit_to_pauli_basis_tile")
     pauli_reshuffle = mod.get_function("pauli_reshuffle")
     single_qubit_ptm = mod.get_function("single_qubit_ptm")
     trace = mod.get_function("trace")
@@ -121,6 +123,28 @@ class TestToPauli:
 
         assert np.allclose(dm, dm2)
 
+    def test_tile_same_as_single_bits(self):
+        dm = random_dm10()
+
+        dm_gpu = drv.to_device(dm)
+        dm_gpu2 = drv.to_device(dm)
+
+        for i in range(no_qubits):
+            bit_to_pauli_basis(dm_gpu, np.int32(1 << i), np.int32(no_qubits),
+                               block=block, grid=grid)
+
+        tile_grid = (1 << (no_qubits - 4), 1 << (no_qubits - 4), 1)
+        for first_bit in range(0, no_qubits, 4):
+            apply_mask = ((1 << min(first_bit + 4, no_qubits)) - 1) & ~((1 << first_bit) - 1)
+            bit_to_pauli_basis_tile(dm_gpu2, np.uint32(min(first_bit, no_qubits - 4)),
+                                    np.uint32(apply_mask), np.uint32(no_qubits),
+                                    block=(16, 16, 1), grid=tile_grid)
+
+        dm1 = drv.from_device_like(dm_gpu, dm)
+        dm2 = drv.from_device_like(dm_gpu2, dm)
+
+        assert np.allclose(dm1, dm2)
+
 class TestTrace:
 
     def test_size_one(self):
@@ -294,6 +318,33 @@ class TestOneBitPTM:
 
         assert np.allclose(dm2, dm)
 
+    def test_fixed_bit_same_as_generic(self):
+        ptm = np.random.random((4, 4))
+
+        ptm_gpu = drv.to_device(ptm)
+
+        dm = np.random.random((512, 512))
+
+        # every bit compiles the whole module, so only check a low and a high one
+        for bit in [0, 4]:
+            fixed_mod = SourceModule(kernel_source,
+                                     options=["-DSINGLE_QUBIT_PTM_BIT=%d" % bit])
+            single_qubit_ptm_fixed_bit = fixed_mod.get_function("single_qubit_ptm_fixed_bit")
+
+            dm_gpu = drv.to_device(dm)
+            dm_gpu2 = drv.to_device(dm)
+
+            single_qubit_ptm(dm_gpu, ptm_gpu, np.int32(bit), np.int32(
+                9), block=(512, 1, 1), grid=(512, 1, 1), shared=8 * (16 + 512))
+            single_qubit_ptm_fixed_bit(dm_gpu2, ptm_gpu, np.int32(
+                9), block=(512, 1, 1), grid=(512, 1, 1), shared=8 * (16 + 512))
+
+            dm1 = drv.from_device_like(dm_gpu, dm)
+            dm2 = drv.from_device_like(dm_gpu2, dm)
+
+            assert not np.allclose(dm1, dm)
+            assert np.allclose(dm1, dm2)
+
 
 class TestTwoBitPTM:
 
@@ -295,6 +295,44 @@ class TestMultipleMeasurement:
 
         assert total_prob == sdm.trace()
 
+    def test_sample_multiple_measurements_gs(self):
+        sdm = SparseDM(3)
+        sdm.ensure_dense(0)
+        sdm.ensure_dense(1)
+
+        samples = sdm.sample_multiple_measurements([0, 1, 2], 100)
+
+        assert samples == [({0: 0, 1: 0, 2: 0}, 100)]
+
+    def test_sample_multiple_measurements_hadamard(self):
+        sdm = SparseDM(3)
+
+        sdm.hadamard(0)
+        sdm.hadamard(2)
+        sdm.classical_probability = 0.5
+
+        samples = sdm.sample_multiple_measurements([0, 1, 2], 4000, rng=42)
+
+        assert sum(count for outcome, count in samples) == 4000
+        assert len(samples) == 4
+        for outcome, count in samples:
+            assert outcome[1] == 0
+            assert 800 < count < 1200
+
+        before = sdm.full_dm.to_array()
+        sdm.sample_multiple_measurements([0, 1, 2], 10)
+        assert np.allclose(before, sdm.full_dm.to_array())
+
+    def test_sample_multiple_measurements_zero_probability(self):
+        sdm = SparseDM(2)
+
+        sdm.hadamard(0)
+        sdm.project_measurement(0, 1)
+        sdm.classical_probability = 0
+
+        with pytest.raises(ValueError):
+            sdm.sample_multiple_measurements([0, 1], 10)
+
 
 def test_renormalize():
     sdm = SparseDM(2)
@@ -33,10 +33,11 @@ def partial_greedy_toposort(partial_orders, targets=set()):
     # drop out empty lists
     partial_orders = [po for po in partial_orders if po]
 
-    order_dicts = []
+    # for every item, its direct predecessors (n, x) in each list n containing it
+    predecessors = {}
     for n, p in enumerate(partial_orders):
-        order_dict = {i: j for i, j in zip(p[1:], p)}
-        order_dicts.append(order_dict)
+        for i, j in zip(p[1:], p):
+            predecessors.setdefault(i, []).append((n, j))
 
     trees = []
     for n, p in enumerate(partial_orders):
@@ -45,15 +46,13 @@ def partial_greedy_toposort(partial_orders, targets=set()):
         while to_do:
             n, x = to_do.pop()
             tree.append((n, x))
-            for n2, o2 in enumerate(order_dicts):
-                x2 = o2.get(x)
-                if x2 is not None:
-                    to_do.append((n2, x2))
+            to_do.extend(predecessors.get(x, ()))
 
         lists_used = {n for n, x in tree if n in targets}
         trees.append((tree, lists_used))
 
     result = []
+    result_set = set()
     all_used = set()
     while trees != []:
         trees.sort(key=lambda xy: len(all_used | xy[1]), reverse=True)
@@ -62,16 +61,18 @@ def partial_greedy_toposort(partial_orders, targets=set()):
         smallest = smallest[0]
         smallest.reverse()
         smallest = [x for n, x in smallest]
+        smallest_set = set(smallest)
 
         new_trees = []
         for l, i in trees:
-            l2 = [(n, x) for n, x in l if x not in smallest]
+            l2 = [(n, x) for n, x in l if x not in smallest_set]
             new_trees.append((l2, i))
 
         trees = new_trees
 
         for s in smallest:
-            if s not in result:
+            if s not in result_set:
+                result_set.add(s)
                 result.append(s)
 
     return result